@@ -21,8 +21,10 @@ import argparse
 import numpy as np
 import logging
 from subprocess import call
+from multiprocessing import Pool, cpu_count
 import re
 import os
+import zlib
 import warnings
 warnings.filterwarnings(action='ignore', category=UserWarning, module='gensim')
 import gensim
@@ -47,9 +49,9 @@ def parse_iim_output(fname, dictionary):
     return iims
 
 def print_timing(func):
-  def wrapper(*arg):
+  def wrapper(*arg, **kwargs):
     t1 = time.time()
-    res = func(*arg)
+    res = func(*arg, **kwargs)
     t2 = time.time()
     t = int(t2-t1)
     s = t % 60
@@ -100,6 +102,220 @@ def eclatLDA(infname, minsup):
 
 # --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
+def hashItem(item):
+    """ stable 64-bit hash of an item (int or str) so that original and generated dbs hash alike """
+    key = str(item).encode()
+    return (zlib.crc32(key) << 32) | zlib.adler32(key)
+
+def hashPairs(first, second):
+    """ 64-bit keys of the item pairs (first[i], second[i]), given as arrays of item hashes """
+    return first * np.uint64(0x9E3779B97F4A7C15) + second  # wraps around mod 2^64
+
+class CountMinSketch:
+    """
+    count-min sketch over integer keys, using multiply-shift hashing (width is rounded up to a power of 2)
+    estimates never undercount; overcount is at most e*total/width with probability 1 - exp(-depth)
+    """
+
+    def __init__(self, width=2 ** 16, depth=4, seed=50):
+        self.logWidth = max(1, int(np.ceil(np.log2(width))))
+        self.depth = depth
+        self.table = np.zeros((depth, 2 ** self.logWidth), dtype=np.int64)
+        rng = np.random.RandomState(seed)  # own generator, so profiling does not disturb the generators' random stream
+        self.a = rng.randint(0, 2 ** 62, size=depth, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)  # odd multipliers
+        self.b = rng.randint(0, 2 ** 62, size=depth, dtype=np.int64).astype(np.uint64)
+        self.rows = np.arange(depth)[:, None]
+
+    def indices(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        # uint64 arithmetic wraps around, i.e. it is computed mod 2^64
+        return ((self.a[:, None] * keys[None, :] + self.b[:, None]) >> np.uint64(64 - self.logWidth)).astype(np.intp)
+
+    def add(self, keys):
+        """ adds one occurrence of each key; returns the updated estimates of keys """
+        indices = self.indices(keys)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(indices[row], minlength=self.table.shape[1])
+        return self.table[self.rows, indices].min(axis=0)
+
+    def estimate(self, keys):
+        return self.table[self.rows, self.indices(keys)].min(axis=0)
+
+class HeavyHitters:
+    """
+    count-min sketch plus the keys with (approximately) the k largest counts:
+    a key is tracked once its estimate exceeds the k-th largest tracked estimate.
+    keys are fed in batches and every step is vectorized over the batch
+    """
+
+    def __init__(self, k=100, width=2 ** 16, depth=4):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.keys = np.zeros(0, dtype=np.uint64)  # tracked keys, at most 2k between prunes
+        self.labels = dict()  # tracked key -> label given to add(), e.g. the items of a pair
+        self.threshold = 0
+
+    def add(self, keys, labels=None):
+        """ labels (optional) holds one row per key, kept for the keys that get tracked """
+        above = np.flatnonzero(self.sketch.add(keys) > self.threshold)
+        (aboveKeys, first) = np.unique(keys[above], return_index=True)
+        isNew = ~np.isin(aboveKeys, self.keys)
+        new = aboveKeys[isNew]
+        if len(new):
+            self.keys = np.concatenate([self.keys, new])
+            if labels is not None:
+                self.labels.update(zip(new.tolist(), map(tuple, labels[above[first[isNew]]].tolist())))
+            if len(self.keys) > 2 * self.k:
+                self.prune()
+
+    def prune(self):
+        estimates = self.sketch.estimate(self.keys)
+        top = np.argsort(-estimates, kind='stable')[:self.k]
+        self.keys = self.keys[top]
+        self.threshold = estimates[top[-1]]
+        if self.labels:
+            self.labels = dict((key, self.labels[key]) for key in self.keys.tolist())
+
+    def estimate(self, keys):
+        return self.sketch.estimate(keys)
+
+    def candidates(self):
+        if len(self.keys) > self.k:
+            self.prune()
+        return self.keys
+
+class DBProfile:
+    """
+    single-pass, bounded-memory profile of a transactional database:
+    item frequencies and pairwise co-occurrences (count-min sketches plus top-k keys, see HeavyHitters)
+    and the exact transaction-length histogram.
+    transactions are fed one at a time through add(), so a profile can be attached
+    to a db loader or to the output stream of any gen(); add() only hashes the transaction into a buffer,
+    which is pushed to the sketches once it holds bufferSize keys
+    """
+
+    def __init__(self, name, width=2 ** 16, depth=4, topk=100, bufferSize=2 ** 20):
+        self.name = name
+        self.ntrans = 0
+        self.lengths = dict()  # transaction length -> nr of transactions
+        self.items = HeavyHitters(topk, width, depth)
+        self.pairs = HeavyHitters(topk, width, depth)
+        self.itemHashes = dict()  # item -> hash, bounded by the item alphabet
+        self.hashedItems = dict()  # hash -> item, to report keys back as items
+        self.pairIndices = dict()  # nr of items -> index pairs (i < j) of a transaction of that size
+        self.bufferSize = bufferSize
+        self.itemBuffer = []
+        self.firstBuffer = []  # item hashes of the first and second item of each buffered pair
+        self.secondBuffer = []
+        self.nbuffered = 0
+
+    @staticmethod
+    def forDB(fname):
+        """ profile for a generator's original or generated db: a DBProfile with --profile, otherwise a NoProfile """
+        return DBProfile(os.path.basename(fname)) if args.profile else NoProfile()
+
+    def hash(self, item):
+        h = self.itemHashes.get(item)
+        if h is None:
+            h = hashItem(item)
+            if h in self.hashedItems and str(self.hashedItems[h]) != str(item):
+                logging.warning("profile {}: items {} and {} have the same hash, their counts are merged".format(self.name, self.hashedItems[h], item))
+            self.itemHashes[item] = h
+            self.hashedItems[h] = item
+        return h
+
+    def add(self, transaction):
+        self.ntrans += 1
+        self.lengths[len(transaction)] = self.lengths.get(len(transaction), 0) + 1
+        # sort by hash, so a pair gets the same key whatever the item order of its transaction
+        try:
+            hashes = set([self.itemHashes[item] for item in transaction])
+        except KeyError:  # item not seen yet
+            hashes = set([self.hash(item) for item in transaction])
+        keys = np.array(sorted(hashes), dtype=np.uint64)
+        if not len(keys):
+            return
+        self.itemBuffer.append(keys)
+        self.nbuffered += len(keys)
+        if len(keys) > 1:
+            if len(keys) not in self.pairIndices:
+                self.pairIndices[len(keys)] = np.triu_indices(len(keys), 1)
+            (first, second) = self.pairIndices[len(keys)]
+            self.firstBuffer.append(keys[first])
+            self.secondBuffer.append(keys[second])
+            self.nbuffered += len(first)
+        if self.nbuffered >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        if self.itemBuffer:
+            self.items.add(np.concatenate(self.itemBuffer))
+        if self.firstBuffer:
+            (first, second) = (np.concatenate(self.firstBuffer), np.concatenate(self.secondBuffer))
+            self.pairs.add(hashPairs(first, second), np.column_stack((first, second)))
+        self.itemBuffer = []
+        self.firstBuffer = []
+        self.secondBuffer = []
+        self.nbuffered = 0
+
+    def meanLength(self):
+        return sum(size * n for (size, n) in self.lengths.items()) / max(1, self.ntrans)
+
+    def lengthDistance(self, other):
+        """ total variation distance between both transaction-length histograms """
+        sizes = set(self.lengths) | set(other.lengths)
+        return 0.5 * sum(abs(self.lengths.get(size, 0) / max(1, self.ntrans) - other.lengths.get(size, 0) / max(1, other.ntrans)) for size in sizes)
+
+    def diff(self, other, nshow=5):
+        """
+        compact report of the differences between this profile (e.g. original db) and other (e.g. generated db)
+        supports (%) are compared on the top items and pairs of both profiles
+        """
+        self.flush()
+        other.flush()
+        items = dict(other.hashedItems)
+        items.update(self.hashedItems)
+        report = ["profile diff: {} vs {}".format(self.name, other.name),
+                  "  transactions: {} vs {}".format(self.ntrans, other.ntrans),
+                  "  mean transaction length: {:0.2f} vs {:0.2f}; length histogram total variation distance: {:0.4f}".format(self.meanLength(), other.meanLength(), self.lengthDistance(other))]
+        pairs = dict(other.pairs.labels)
+        pairs.update(self.pairs.labels)
+        for (label, origTop, genTop, describe) in [("items", self.items, other.items, lambda key: items[key]),
+                                                   ("pairs", self.pairs, other.pairs, lambda key: tuple(items[h] for h in pairs[key]))]:
+            candidates = np.union1d(origTop.candidates(), genTop.candidates())
+            if not len(candidates):
+                continue
+            origSupport = 100.0 * origTop.estimate(candidates) / max(1, self.ntrans)
+            genSupport = 100.0 * genTop.estimate(candidates) / max(1, other.ntrans)
+            absDiff = np.abs(origSupport - genSupport)
+            report.append("  top {}: {} compared; support diff mean {:0.2f}%, max {:0.2f}%".format(label, len(candidates), absDiff.mean(), absDiff.max()))
+            for i in np.argsort(-absDiff)[:nshow]:
+                report.append("    {}: {:0.2f}% vs {:0.2f}%".format(describe(int(candidates[i])), origSupport[i], genSupport[i]))
+        return "\n".join(report)
+
+class NoProfile:
+    """ stands in for DBProfile when profiling is off """
+
+    def add(self, transaction):
+        pass
+
+def logProfileDiff(origProfile, genProfile):
+    """ logs the diff report of a generator's profiles, if profiling is on """
+    if isinstance(genProfile, DBProfile):
+        logging.info(origProfile.diff(genProfile))
+
+@print_timing
+def profileDBFile(fname):
+    """ profiles a db file (e.g. a previously generated one) in a single pass """
+    profile = DBProfile(os.path.basename(fname))
+    with open(fname) as inf:
+        for row in inf:
+            profile.add(row.split())
+    logging.info("profiled file {} ; {} transactions".format(fname, profile.ntrans))
+    return profile
+
+# --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
 class KrimpGen:
     def __init__(self, indb):
         # Item data -> Categorical data -> Krimp format -> Categorical data -> Item data.
@@ -119,11 +335,14 @@ class KrimpGen:
         self.domainToItem = dict()  # map any element of a domain to its item.
         self.categToKrimp = dict()  # map categorical format to krimp's
         self.krimpToCateg = dict()  # map krimp's format to categorical format.
+        self.origProfile = DBProfile.forDB(self.origDBfileName)
+        self.genProfile = None
         with open(self.origDBfilePath) as infile:
             for row in infile:
                 transaction = sorted([int(item.strip()) for item in row.strip().split(" ")])
                 self.items |= set(transaction)
                 self.originalDB.append(transaction)
+                self.origProfile.add(transaction)
             logging.info("Nr of transactions in {}: {}, Nr. of items: {}".format(self.origDBfileName, len(self.originalDB), len(self.items)))
         self.itemAlphabet = sorted(list(self.items))
         self.toCategAlphabet()
@@ -272,6 +491,7 @@ class KrimpGen:
 
     @print_timing
     def gen(self):  # Categorical data -> Item data
+        self.genProfile = DBProfile.forDB(self.GenDBfilePath)
         with open(self.GenDBfilePath, 'w') as genFile:
             ntrans = 0
             for i in range(len(self.originalDB)):
@@ -284,16 +504,19 @@ class KrimpGen:
                     newTransaction += itemset  # must be an union of disjoint itemsets.
                     domains -= set(self.getDomains(itemset))
                     CTavailableIndexes = self.removeCTelements(CTavailableIndexes, itemset)
-                newTrans = " ".join(sorted(self.convertToItemsets(newTransaction)))
+                newItems = self.convertToItemsets(newTransaction)
+                newTrans = " ".join(sorted(newItems))
                 logging.debug("===> generating transaction nr: {}; generated transaction: {}".format(i, newTrans))
                 if len(newTrans):
                     genFile.write(newTrans + "\n")
                     logging.debug("writing transaction to new db: {}".format(newTrans))
                     ntrans += 1
+                    self.genProfile.add(newItems)
                 # REPORT progress
                 if i and i % 1000 == 0:
                     logging.info("\tprocessed {} transactions of {} ({:0.1f}%).".format(i, len(self.originalDB), 100.0 * i / len(self.originalDB)))
             logging.info("wrote synthetic database to file {}, with {} transactions ({:0.1f}%)".format(self.GenDBfilePath, ntrans, 100.0 * ntrans / len(self.originalDB)))
+        logProfileDiff(self.origProfile, self.genProfile)
         return len(self.GenDBfilePath)
 
 # --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -309,15 +532,19 @@ class IGMGen:
         self.origDBbaseName = os.path.splitext(os.path.basename(indb))[0]
         self.origDBfilePath = os.path.join(os.getcwd(), "db", indb)  # Original DB file name e.g. chess.dat
         self.GenDBfilePath = os.path.join(os.getcwd(), "db", "gen-igm-{}-minsup-{}".format(self.origDBbaseName, args.igm_minsup))  # Newly generated DB file name.
+        self.fiCacheFilePath = os.path.join(os.getcwd(), "out", "eclat-igm-{}.fi.npz".format(self.origDBbaseName))  # interesting frequent itemsets mined at the lowest minsup so far, see getFI.
         self.originalDB = []  # this one saves the original DB.         #  parse input file, figure out various statistics from dbfile
         self.modelFileName = None  # to be determined on learn execution, depends on parameters. Same as igm class variable but this one is saved in file.
         self.igmModel = None  # model parameters [(itemset, prob),...]
         self.itemAlphabet = set()  # This is used to know the number of different items in original DB. It saves the item's alphabet.
+        self.origProfile = DBProfile.forDB(self.origDBfileName)
+        self.genProfile = None
         with open(self.origDBfilePath) as infile:
             for row in infile:
                 transaction = [int(item.strip()) for item in row.strip().split(" ")]  # transaction = [item.strip().replace(" ", "_") for item in row.strip().split(',')]
                 self.itemAlphabet |= set(transaction)
                 self.originalDB.append(sorted(transaction))
+                self.origProfile.add(transaction)
             logging.info("Nr of transactions in {}: {}, Nr. of items: {}".format(self.origDBfileName, len(self.originalDB), len(self.itemAlphabet)))
 
     @print_timing
@@ -327,13 +554,13 @@ class IGMGen:
             self.loadIgmModelFromFile()
         else:
             logging.info("running IGM inference; minsup = {} on file: {}".format(minsup, self.origDBfileName))
-            fi = self.getFI(minsup)  # get the frequent itemsets of the original DB. (e.g. using eclat) Format: [(itemset, prob),...]
-            self.igmModel = self.filterFI(fi)  # Select the set of interesting itemsets following the concept proposed by Laxman et.al.
+            self.igmModel = self.getFI(minsup)  # get the interesting frequent itemsets (following the concept proposed by Laxman et.al.) of the original DB. Format: [(itemset, prob),...]
             self.saveIgmModeltoFile()
         return len(self.igmModel)
 
     @print_timing
     def gen(self):
+        self.genProfile = DBProfile.forDB(self.GenDBfilePath)
         with open(self.GenDBfilePath, 'w') as genFile:
             ntrans = 0
             for i in range(len(self.originalDB)):
@@ -352,10 +579,12 @@ class IGMGen:
                     genFile.write(newTrans + "\n")
                     logging.info("writing transaction to new db: {}".format(newTrans))
                     ntrans += 1
+                    self.genProfile.add(newTransaction)
                 # REPORT progress
                 if i and i % 1000 == 0:
                     logging.info("\tprocessed {} transactions of {} ({:0.1f}%).".format(i, len(self.originalDB), 100.0 * i / len(self.originalDB)))
             logging.info("wrote synthetic database to file {}, with {} transactions ({:0.1f}%)".format(self.GenDBfilePath, ntrans, 100.0 * ntrans / len(self.originalDB)))
+        logProfileDiff(self.origProfile, self.genProfile)
         return len(self.GenDBfilePath)
 
     def loadIgmModelFromFile(self):
@@ -377,37 +606,77 @@ class IGMGen:
 
     @print_timing
     def getFI(self, minsup):
-        """ runs eclat on input db. Prints the frequent itemsets on a file and returns them as well
-            Input DB format: other vegetables,whole milk (7.48348)  Obs: Ensure not to use the nr of transaction but the ratio """
+        """ returns the interesting frequent itemsets (see isInteresting) of the input db for minsup, in eclat's order.
+            they are served from the per-db cache file whenever it was mined at a minsup not above this one (interesting
+            itemsets do not depend on minsup, so the answer is a subset of the cache) and was mined from this very db
+            (same nr of transactions, file size and modification time); otherwise eclat is run and the cache replaced.
+            minsup: positive = percentage of transactions, negative = exact number of transactions (as eclat's -s) """
+        minCount = self.minsupCount(minsup)
+        if os.path.exists(self.fiCacheFilePath):
+            with np.load(self.fiCacheFilePath) as cache:
+                if "dbStamp" in cache.files and cache["dbStamp"].tolist() == self.dbStamp() and minCount >= int(cache["minCount"]):
+                    counts = cache["counts"]
+                    offsets = cache["offsets"].tolist()
+                    items = cache["items"].tolist()
+                    fi = [(items[offsets[i]:offsets[i + 1]], 100.0 * int(counts[i]) / len(self.originalDB)) for i in np.flatnonzero(counts >= minCount)]
+                    logging.info("frequent itemsets for minsup {} served from cache file {} (mined at {} transactions) total {}".format(minsup, self.fiCacheFilePath, int(cache["minCount"]), len(fi)))
+                    return fi
         outfname = os.path.join(os.getcwd(), "out", "eclat-igm-{}-{}.itemsets".format(self.origDBbaseName, minsup))
         if platform == "win32":
             eclatPath = os.path.join(os.getcwd(), "exe", "eclat.exe")
         elif platform == "linux" or platform == "linux2":
             eclatPath = os.path.join(os.getcwd(), "exe", "eclat")
-        cmd = [eclatPath, '-f" "', "-s{}".format(minsup), "-k{}".format(" "), self.origDBfilePath, outfname]
+        cmd = [eclatPath, '-f" "', "-s{}".format(minsup), "-k{}".format(" "), "-v (%a)", self.origDBfilePath, outfname]  # -v (%a) prints the absolute support
         logging.info("running eclat command: {} over the original file : {}".format(" ".join(cmd), self.origDBfileName))
         call(cmd)
         logging.info("wrote frequent itemsets in file {}".format(outfname))
+        fi = self.parseFI(outfname)
+        self.saveFIcache(fi, minCount)
+        return [(itemset, 100.0 * count / len(self.originalDB)) for (itemset, count) in fi]
+
+    def dbStamp(self):
+        """ identifies the original db the frequent itemset cache was mined from """
+        return [len(self.originalDB), os.path.getsize(self.origDBfilePath), int(os.path.getmtime(self.origDBfilePath))]
+
+    def minsupCount(self, minsup):
+        """ minimum nr of transactions eclat requires for minsup (percentage if positive, nr of transactions if negative) """
+        if float(minsup) < 0:
+            return int(-float(minsup))
+        return max(1, int(np.ceil(float(minsup) / 100.0 * len(self.originalDB) * (1 - np.finfo(float).eps))))
+
+    def parseFI(self, fname):
+        """ streams an eclat output file (lines like '2 5 8 3 (74)', absolute support) keeping only the interesting itemsets
+            returns [(itemset, count),...] """
         fi = []
-        with open(outfname) as fiFile:
+        nread = 0
+        with open(fname) as fiFile:
             for line in fiFile:
-                if len(line):
-                    m = re.match(r'(.+)\(([\d\.]+)\)', line)
-                    if m:
-                        itemset = [int(item.strip()) for item in m.group(1).strip().split(" ")]
-                        freq = float(m.group(2).strip())
-                        # print("itemset: ", itemset , "freq: " , freq)
-                        fi.append((itemset, freq))
-            logging.info("frequent itemsets loaded from file {} total {}".format(outfname, len(fi)))
+                body, _, count = line.rpartition("(")
+                if not body:
+                    continue
+                nread += 1
+                itemset = [int(item) for item in body.split()]
+                count = int(count.strip().rstrip(")"))
+                if self.isInteresting(itemset, 100.0 * count / len(self.originalDB)):
+                    fi.append((itemset, count))
+            logging.info("frequent itemsets loaded from file {} total {}, interesting {}".format(fname, nread, len(fi)))
         return fi
 
-    def filterFI(self, fi):
-        interestingFI = []
-        for (itemset, frequency) in fi:   # fi = [ ([2,5,8,3], 74.5), ... ]
-            threshold = 100 * (1 / (2 ** len(itemset)))
-            if frequency > threshold:
-                interestingFI.append((itemset, frequency))
-        return interestingFI
+    def saveFIcache(self, fi, minCount):
+        """ compact binary form: all itemsets concatenated in items, itemset i being items[offsets[i]:offsets[i+1]] """
+        lengths = [len(itemset) for (itemset, _) in fi]
+        offsets = np.zeros(len(fi) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        items = np.fromiter((item for (itemset, _) in fi for item in itemset), dtype=np.int32, count=int(offsets[-1]))
+        counts = np.array([count for (_, count) in fi], dtype=np.int64)
+        with open(self.fiCacheFilePath, 'wb') as cacheFile:
+            np.savez(cacheFile, minCount=minCount, dbStamp=np.array(self.dbStamp(), dtype=np.int64), items=items, offsets=offsets, counts=counts)
+        logging.info("wrote frequent itemset cache file {} (mined at {} transactions, {} itemsets)".format(self.fiCacheFilePath, minCount, len(fi)))
+
+    def isInteresting(self, itemset, frequency):
+        """ interesting itemsets following the concept proposed by Laxman et.al.; frequency in % """
+        threshold = 100 * (1 / (2 ** len(itemset)))
+        return frequency > threshold
 
     def chooseItemset(self):
         freq = [p for (itemset, p) in self.igmModel]
@@ -449,6 +718,30 @@ class IGMGen:
         return subsets[np.random.choice(len(subsets), p=[freq / sumfreq for freq in freqList])]
 
 # --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+def evalTopicCount(params):
+    """
+    trains an lda model with K topics on the train corpus, one pass at a time, stopping early once the
+    held-out per-word likelihood bound improves by less than tol (relative); module level so that it can run in a Pool
+    returns (K, score), higher score is better: held-out bound for measure 'perplexity', u_mass coherence for 'u_mass'
+    """
+    (K, train, heldout, dictionary, maxPasses, tol, measure) = params
+    lda = gensim.models.ldamodel.LdaModel(id2word=dictionary, num_topics=K, alpha='auto')
+    bound = None
+    for npass in range(1, int(maxPasses) + 1):
+        lda.update(train)
+        newBound = lda.log_perplexity(heldout)
+        logging.debug("K = {}, pass {}: held-out per-word bound {:0.4f}".format(K, npass, newBound))
+        if bound is not None and newBound - bound < tol * abs(bound):
+            bound = max(bound, newBound)
+            break
+        bound = newBound
+    if measure == 'u_mass':
+        score = gensim.models.CoherenceModel(model=lda, corpus=heldout, dictionary=dictionary, coherence='u_mass').get_coherence()
+    else:
+        score = bound
+    logging.info("K = {}: {} score {:0.4f} after {} passes".format(K, measure, score, npass))
+    return (K, score)
+
 class LDALearnGen:
     """
     DB Generator module that uses Latent Dirichlet Allocation
@@ -467,11 +760,14 @@ class LDALearnGen:
         # parse input file, figure out various statistics from dbfile
         self.originalDB = []
         self.itemAlphabet = set()
+        self.origProfile = DBProfile.forDB(self.origDBfileName)
+        self.genProfile = None
         with open(self.origDBfilePath) as infile:
             for row in infile:
                 transaction = [item.strip() for item in row.strip().split(" ")]
                 self.itemAlphabet |= set(transaction)
                 self.originalDB.append(sorted(transaction))
+                self.origProfile.add(transaction)
         logging.info("Nr of transactions in {}: {}, Nr. of items: {}".format(self.origDBfileName, len(self.originalDB),
                                                                     len(self.itemAlphabet)))
 
@@ -503,23 +799,84 @@ class LDALearnGen:
         for k in range(K):
             logging.debug(self.lda.print_topic(k))
 
+    @print_timing
+    def selectK(self, maxK, measure='perplexity', sampleSize=10000, heldoutRatio=0.2, maxPasses=10, tol=1e-3, nprocs=None):
+        """
+        chooses the nr of topics for learn() instead of training with maxK topics (e.g. the nr of frequent itemsets)
+        candidates 2, 4, 8, ... up to maxK, and never more than the nr of distinct items of the sample,
+        are evaluated on a random subsample of the db (see evalTopicCount) in increasing order, nprocs (default: all cores) at a time;
+        the search stops at the first candidate that does not improve on the best score so far
+        the chosen K is cached in the models directory and reused by later runs
+        """
+        if int(maxPasses) < 1:
+            raise ValueError("selectK needs maxPasses >= 1, got {}".format(maxPasses))
+        KFilePath = os.path.join(os.getcwd(), "models", "lda_K_{}_minsup{}_{}".format(self.origDBbaseName, args.lda_minsup, measure))
+        if os.path.exists(KFilePath):
+            with open(KFilePath) as inf:
+                K = int(inf.readline().strip())
+            logging.info("nr of topics K = {} loaded from file {}".format(K, KFilePath))
+            return K
+        # subsample and split into train / held-out corpus; own generator, so selection does not disturb gen()'s random stream
+        rng = np.random.RandomState(50)
+        sample = [self.originalDB[i] for i in rng.permutation(len(self.originalDB))[:sampleSize]]
+        dictionary = corpora.Dictionary(sample)
+        corpus = [dictionary.doc2bow(trans) for trans in sample]
+        nheldout = max(1, int(heldoutRatio * len(corpus)))
+        train, heldout = corpus[nheldout:], corpus[:nheldout]
+        maxK = max(2, min(int(maxK), len(dictionary)))  # more topics than items is pointless
+        candidates = [2 ** i for i in range(1, int(np.log2(maxK)) + 1)]
+        logging.info("selecting K among {} on {} train / {} held-out transactions; measure = {}".format(candidates, len(train), len(heldout), measure))
+        bestK, bestScore = None, None
+        pool = Pool(min(nprocs or cpu_count(), len(candidates)))
+        try:
+            # imap hands out candidates in increasing order, so at most nprocs of them run ahead of the stopping test
+            for (K, score) in pool.imap(evalTopicCount, ((K, train, heldout, dictionary, maxPasses, tol, measure) for K in candidates)):
+                if bestScore is not None and score <= bestScore:
+                    logging.info("K = {} does not improve on K = {}; stopping search".format(K, bestK))
+                    break
+                bestK, bestScore = K, score
+        finally:
+            pool.terminate()  # drops the candidates still running after an early stop
+            pool.join()
+        with open(KFilePath, 'w') as outf:
+            outf.write(str(bestK) + "\n")
+        logging.info("selected nr of topics K = {} ({} score {:0.4f}); saved to file {}".format(bestK, measure, bestScore, KFilePath))
+        return bestK
+
     @print_timing
     def gen(self):
         """
         from learned model, generate synthetic database using probabilistic model
+        the input is grouped by distinct transaction, so that the topic mixture of each distinct transaction
+        is inferred once and used for all its duplicates, which are generated one after the other
         returns new database file name
         """
         topics = self.lda.get_topics()
+        self.genProfile = DBProfile.forDB(self.GenDBfilePath)
         genDB = []
         genDBsize = len(self.originalDB)  # use same size of original database
-        for i in range(genDBsize):
+        groups = []  # [index of first occurrence, nr of occurrences] of each distinct transaction
+        groupOf = dict()
+        for i, trans in enumerate(self.originalDB):
+            key = tuple(trans)
+            if key in groupOf:
+                groups[groupOf[key]][1] += 1
+            else:
+                groupOf[key] = len(groups)
+                groups.append([i, 1])
+        del groupOf
+        logging.info("{} distinct transactions out of {}".format(len(groups), genDBsize))
+        previous = None
+        for n, i in enumerate(i for (i, count) in groups for _ in range(count)):
             # use same length of transaction as original database
             transSize = len(self.originalDB[i])
-            # use multinomial for transaction according to fitted lda model
-            mixture = self.lda[self.dictionary.doc2bow(self.originalDB[i])]
-            logging.debug("topic mixture for transaction {}: {}".format(i, mixture))
+            if i != previous:
+                # use multinomial for transaction according to fitted lda model
+                mixture = [x for _, x in self.lda[self.dictionary.doc2bow(self.originalDB[i])]]
+                logging.debug("topic mixture for transaction {}: {}".format(i, mixture))
+                previous = i
             # chose topics acording to multinomial mixture, for all words at once
-            trans_topics = np.random.multinomial(transSize, [x for _, x in mixture])
+            trans_topics = np.random.multinomial(transSize, mixture)
             # now, generate words for each of the chosen topics
             this_transaction = set()
             for j, x in enumerate(trans_topics):
@@ -536,14 +893,15 @@ class LDALearnGen:
                             this_transaction.add(self.dictionary[l])
             # add created transaction to new db
             genDB.append(sorted(this_transaction))
+            self.genProfile.add(this_transaction)
             logging.debug(">>original transaction size {}, generated transaction size {}".format(transSize, len(
                 this_transaction)))
             logging.debug(">>original transaction: {}, generated transaction: {}".format(sorted(self.originalDB[i]),
                                                                                          sorted(this_transaction)))
             # REPORT progress
-            if i and i % 1000 == 0:
+            if n and n % 1000 == 0:
                 logging.info(
-                    "\tprocessed {} transactions of {} ({:0.1f}%).".format(i, genDBsize, 100.0 * i / genDBsize))
+                    "\tprocessed {} transactions of {} ({:0.1f}%).".format(n, genDBsize, 100.0 * n / genDBsize))
         # write result to file
         outf = open(self.GenDBfilePath, "w")
         for trans in genDB:
@@ -551,7 +909,8 @@ class LDALearnGen:
             outf.write(newitems + "\n")
             logging.debug("writing transaction to new db: {}".format(newitems))
         outf.close()
-        logging.info("wrote synthetic database to file {}".format(self.GenDBfilePath))
+        logging.info("wrote synthetic database to file {}; topic inference run for {} of {} transactions".format(self.GenDBfilePath, len(groups), genDBsize))
+        logProfileDiff(self.origProfile, self.genProfile)
         return self.GenDBfilePath
 
     def load(self):
@@ -579,11 +938,14 @@ class IIMLearnGen:
         self.iimsModel = None
         self.originalDB = []
         self.itemAlphabet = set()
+        self.origProfile = DBProfile.forDB(self.origDBfileName)
+        self.genProfile = None
         with open(self.origDBfilePath) as inf:
             for row in inf:
                     transaction = sorted([int(item.strip()) for item in row.strip().split(" ")])
                     self.originalDB.append(transaction)
                     self.itemAlphabet |= set(transaction)
+                    self.origProfile.add(transaction)
         logging.info("load input file {} ; {} transactions found with {} items".format(self.origDBfileName, len(self.originalDB), len(self.itemAlphabet)))
 
     @print_timing
@@ -616,6 +978,7 @@ class IIMLearnGen:
         from learned model, generate synthetic database using probabilistic model iim
         returns new database file name
         """
+        self.genProfile = DBProfile.forDB(self.GenDBfilePath)
         with open(self.GenDBfilePath, 'w') as outf:
             ntrans = 0
             oriDBsize = len(self.originalDB)
@@ -632,10 +995,12 @@ class IIMLearnGen:
                     outf.write(genTrans + "\n")
                     logging.debug("writing transaction to new db: {}".format(genTrans))
                     ntrans += 1
+                    self.genProfile.add(newTrans)
                 # REPORT progress
                 if i and i % 1000 == 0:
                     logging.info("\tprocessed {} transactions of {} ({:0.1f}%).".format(i, oriDBsize, 100.0*i/oriDBsize))
         logging.info("wrote synthetic database to file {}, with {} transactions ({:0.1f}%)".format(self.GenDBfilePath, ntrans, 100.0*ntrans/oriDBsize))
+        logProfileDiff(self.origProfile, self.genProfile)
         return self.GenDBfilePath
 
     def getiimsModel(self, fname):
@@ -693,6 +1058,9 @@ if __name__ == '__main__':
     parser.add_argument('--krimp_type', default='all', help='Candidate type determined by [ all | cls | closed ]')
     parser.add_argument('--krimp_CTfilename', default=None, help='CT name file')
 
+    parser.add_argument('--profile', action='store_true', help='Sketch-based profile of original and generated DBs, logged as a diff report after gen')
+    parser.add_argument('--profile_gendb', default=None, help='Already generated DB (in db/) to profile against --dbfile; no generator is run')
+
     # parser.add_argument('--minsup', default=75, help='Minimum support threshold')
 
     args = parser.parse_args()
@@ -712,6 +1080,7 @@ if __name__ == '__main__':
     # logging.info("Nr of frequent itemsets found is: '{}' (future K for lda generator)".format(K))
     # # now, run first generator model (lda) and then eclat on synthetic db
     # lda = LDALearnGen(args.dbfile)
+    # K = lda.selectK(K)  # choose K on a subsample instead of the nr of frequent itemsets ('perplexity' or 'u_mass')
     # lda.learn(K, args.lda_passes)
     # lda.gen()
 
@@ -727,9 +1096,14 @@ if __name__ == '__main__':
     # -------------------------------------------------------------
     # IGM generator model (igm)
 
-    igm = IGMGen(args.dbfile)
-    igm.learn(args.igm_minsup)
-    igm.gen()
+    if args.profile_gendb:
+        # fidelity check of an existing synthetic db, without generating again
+        origProfile = profileDBFile(os.path.join(os.getcwd(), "db", args.dbfile))
+        logProfileDiff(origProfile, profileDBFile(os.path.join(os.getcwd(), "db", args.profile_gendb)))
+    else:
+        igm = IGMGen(args.dbfile)
+        igm.learn(args.igm_minsup)
+        igm.gen()
 
     # eclatLDA(igm.GenDBfilePath, args.igm_minsup)
     # -------------------------------------------------------------